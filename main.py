@@ -1,15 +1,124 @@
 import os
 import time
+import random
+import functools
+import hmac
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import functions_framework
-import json
-import requests
-from firebase_admin import initialize_app, firestore, get_app, credentials
-from google.cloud.firestore import Client, DocumentReference
-from flask import jsonify
+import orjson
+from cachetools import TTLCache
+from firebase_admin import initialize_app, firestore, get_app
+from google.cloud.firestore import Client, CollectionReference, DocumentReference
+from flask import Response, jsonify, stream_with_context
 
 # --- API Configuration ---
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent"
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:streamGenerateContent"
 API_KEY = os.environ.get("API_KEY", "")
+# The key travels in a header so the URL, which httpx logs and puts in exception messages, never carries it
+_URL = f"{GEMINI_API_URL}?alt=sse"
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_GEMINI_HEADERS = {**_JSON_HEADERS, "x-goog-api-key": API_KEY}
+
+# --- PROMPT TEMPLATES ---
+def _build_system_instruction(language):
+    """Builds the Gemini systemInstruction block for the requested response language."""
+    system_prompt = (
+        "You are HealthAlly, a culturally sensitive, preliminary AI health guide. "
+        "You MUST be extremely cautious and non-diagnostic. Your response MUST be in the requested language, which is "
+        f"'{language}'. "
+        "Your response must include three clearly separated sections using markdown bolding and list formatting, in this exact order:\n"
+        "1. **IMPORTANT DISCLAIMER:** A bold, explicit warning that you are NOT a doctor and your advice is not a diagnosis. State: 'This information is for informational purposes only. Consult a verified doctor immediately for a diagnosis.'\n"
+        "2. **Possible Common Causes:** A list of 3-5 possible, common, non-life-threatening causes for the symptoms.\n"
+        "3. **Recommended Next Steps:** Clear, conservative advice, such as 'Monitor symptoms for 24 hours and stay hydrated' or 'Seek immediate medical attention if symptoms worsen or include chest pain/difficulty breathing.'\n"
+        "Keep the response professional, empathetic, and focus on the patient's safety. Use concise, clear language."
+    )
+    return {"parts": [{"text": system_prompt}]}
+
+# Prebuilt for the languages offered by the frontend; requests for anything else are rejected.
+SUPPORTED_LANGUAGES = frozenset({"English", "Urdu", "Punjabi"})
+SYS_PROMPTS = {lang: _build_system_instruction(lang) for lang in SUPPORTED_LANGUAGES}
+MAX_SYMPTOMS_LENGTH = 4096
+_TOOLS = [{"google_search": {}}]
+_QPREFIX = "The patient reports the following symptoms: "
+_QSUFFIX = ". Provide a preliminary analysis."
+
+# --- ANALYSIS CACHE ---
+# Completed analyses keyed by (symptoms, language), so repeated queries on a warm
+# instance are answered without calling Gemini. TTLCache is not thread-safe.
+ANALYSIS_CACHE_SIZE = 512
+ANALYSIS_CACHE_TTL = 3600
+_ANALYSIS_CACHE = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL)
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+
+# --- HTTP CLIENT ---
+# Module-level HTTP/2 client so warm instances keep their TLS connection to Gemini.
+# Concurrent requests on a 2nd gen instance are multiplexed over that connection
+# instead of each holding a socket of its own. httpx is only imported when the
+# client is first needed, so pmdc_verify_doctor cold starts never load it.
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+def _get_client():
+    """Returns the shared Gemini HTTP client, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                import httpx
+                _CLIENT = httpx.Client(
+                    http2=True,
+                    timeout=30.0,
+                    limits=httpx.Limits(max_keepalive_connections=8, max_connections=16)
+                )
+    return _CLIENT
+
+# --- RETRY POLICY ---
+MAX_RETRIES = 3
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+RETRY_JITTER = 0.5
+
+def _retry_delay(attempt, response):
+    """
+    Returns a jittered exponential backoff delay, honouring Retry-After when the
+    server sends one. Retry-After is capped at RETRY_MAX_DELAY so a long value
+    cannot hold the request open.
+    """
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    delay *= 1 + random.uniform(-RETRY_JITTER, RETRY_JITTER)
+    retry_after = 0
+    if response is not None:
+        try:
+            retry_after = min(int(response.headers.get("Retry-After", 0)), RETRY_MAX_DELAY)
+        except ValueError:
+            # HTTP-date form of Retry-After; fall back to the computed delay
+            retry_after = 0
+    return max(delay, retry_after)
+
+def _post_gemini(payload):
+    """
+    POSTs the payload to Gemini and returns the open streaming response.
+    Transport errors and RETRY_STATUSES are retried with backoff; other
+    responses are returned straight away since they will not succeed on retry.
+    """
+    import httpx
+    client = _get_client()
+    gemini_request = client.build_request("POST", _URL, content=orjson.dumps(payload), headers=_GEMINI_HEADERS)
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            response = client.send(gemini_request, stream=True)
+        except httpx.TransportError:
+            if attempt == MAX_RETRIES:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                return response
+            response.close()
+        time.sleep(_retry_delay(attempt, response))
 
 # --- FIREBASE ADMIN SETUP ---
 # Initialize Firebase Admin SDK
@@ -27,6 +136,7 @@ except ValueError:
     
     if os.path.exists(service_account_path):
         # Local development with service account key
+        from firebase_admin import credentials
         cred = credentials.Certificate(service_account_path)
         initialize_app(cred)
     else:
@@ -35,16 +145,175 @@ except ValueError:
     
     db: Client = firestore.client()
 
+# Background writer for Firestore updates the client does not need to wait on.
+# By default 2nd gen only allocates CPU while a request is in flight, so deploy
+# pmdc_verify_doctor with always-allocated CPU (see the README) or queued writes
+# can stall between requests. Buffered writes are committed at exit below.
+_EXEC = ThreadPoolExecutor(max_workers=4, thread_name_prefix="firestore-writer")
+
+def _log_write_failure(future):
+    """Done-callback that reports background Firestore write errors."""
+    exc = future.exception()
+    if exc is not None:
+        print(f"Background Firestore update failed: {exc}")
+
+# Warm the Firestore gRPC channel (DNS, TLS, auth token) once per worker, off the
+# request path. This must not run at import: functions-framework imports main.py
+# in the gunicorn master before forking, and a gRPC channel cannot cross fork().
+# Failures here are harmless; the short timeout without retries keeps a slow
+# Firestore from tying up a writer thread.
+FIRESTORE_WARMUP_TIMEOUT = 3.0
+_WARMUP_STARTED = False
+_WARMUP_LOCK = threading.Lock()
+
+def _warm_firestore():
+    """Runs a tiny query so the channel is open before the first batch commit."""
+    try:
+        list(db.collection("_warmup").limit(1).stream(retry=None, timeout=FIRESTORE_WARMUP_TIMEOUT))
+    except Exception as e:
+        print(f"Firestore warmup skipped: {e}")
+
+def _start_firestore_warmup():
+    """Submits the Firestore warmup to the writer pool the first time it is called."""
+    global _WARMUP_STARTED
+    if _WARMUP_STARTED:
+        return
+    with _WARMUP_LOCK:
+        if _WARMUP_STARTED:
+            return
+        _WARMUP_STARTED = True
+    _EXEC.submit(_warm_firestore)
+
+# --- BATCHED FIRESTORE WRITES ---
+# Verification updates are buffered and committed together as one WriteBatch,
+# flushed once BATCH_MAX_OPS are queued or BATCH_MAX_DELAY seconds after the
+# first one arrives. A WriteBatch is atomic and doctorId comes from the client,
+# so if the batch fails each update is retried on its own; one missing profile
+# then only fails its own write.
+BATCH_MAX_OPS = 50
+BATCH_MAX_DELAY = 0.2
+_BATCH_BUF = []
+_BATCH_LOCK = threading.Lock()
+
+def _commit_batch(ops):
+    """
+    Commits the buffered (ref, data) updates in a single WriteBatch, falling
+    back to one update per document if the batch as a whole is rejected.
+    """
+    batch = db.batch()
+    for ref, data in ops:
+        batch.update(ref, data)
+    try:
+        batch.commit()
+    except Exception as e:
+        print(f"Batched Firestore update failed, retrying {len(ops)} updates individually: {e}")
+        for ref, data in ops:
+            try:
+                ref.update(data)
+            except Exception as ref_err:
+                print(f"Firestore update failed for {ref.path}: {ref_err}")
+
+def _flush_batch():
+    """Takes everything currently buffered and commits it on the writer pool."""
+    with _BATCH_LOCK:
+        ops = _BATCH_BUF[:]
+        _BATCH_BUF.clear()
+    if not ops:
+        return
+    try:
+        future = _EXEC.submit(_commit_batch, ops)
+    except RuntimeError:
+        # The pool refuses new work once interpreter shutdown has begun, and the
+        # buffer is already cleared, so commit here rather than drop the ops
+        _commit_batch(ops)
+        return
+    future.add_done_callback(_log_write_failure)
+
+def _queue_update(ref, data):
+    """Buffers a document update for the next batch commit."""
+    with _BATCH_LOCK:
+        _BATCH_BUF.append((ref, data))
+        size = len(_BATCH_BUF)
+    if size >= BATCH_MAX_OPS:
+        _flush_batch()
+    elif size == 1:
+        timer = threading.Timer(BATCH_MAX_DELAY, _flush_batch)
+        timer.daemon = True
+        timer.start()
+
+def _drain_background_writes():
+    """
+    atexit hook that commits whatever is still buffered, then waits for in-flight
+    writes. gunicorn installs its own SIGTERM handlers, but workers leave through
+    sys.exit, so this runs; the batch timer is a daemon thread and would not.
+    """
+    with _BATCH_LOCK:
+        ops = _BATCH_BUF[:]
+        _BATCH_BUF.clear()
+    if ops:
+        # Committed synchronously; the writer pool may already be shutting down
+        _commit_batch(ops)
+    _EXEC.shutdown(wait=True)
+
+atexit.register(_drain_background_writes)
+
+@functools.lru_cache(maxsize=32)
+def _doctors_collection(app_id) -> CollectionReference:
+    """Returns the cached doctor_profiles collection reference for an app."""
+    return (db.collection("artifacts").document(app_id)
+            .collection("public").document("data")
+            .collection("doctor_profiles"))
+
+# --- PMDC VERIFICATION ---
+MOCK_PMDC_NUMBER = "PMDC-12345"
+_MOCK_PMDC_BYTES = MOCK_PMDC_NUMBER.encode()
+# Copied per request before doctorId is added
+_REJECT_TMPL = {
+    "verified": False,
+    "message": "PMDC number failed mock verification check. Please check the number and try again."
+}
+
+# --- PRE-SERIALIZED ERROR RESPONSES ---
+# (body, status) pairs for the static error shapes, serialized once at import
+_ERR_NO_JSON = (orjson.dumps({"error": "No JSON payload provided."}), 400)
+_ERR_MISSING_PMDC_FIELDS = (orjson.dumps({"error": "Missing doctorId, pmdcNumber, or appId."}), 400)
+_ERR_PMDC_ID_TYPE = (orjson.dumps({"error": "doctorId and appId must be strings."}), 400)
+_ERR_MISSING_SYMPTOMS = (orjson.dumps({"error": "Missing symptoms input."}), 400)
+_ERR_SYMPTOMS_TYPE = (orjson.dumps({"error": "symptoms must be a string."}), 400)
+_ERR_SYMPTOMS_TOO_LONG = (orjson.dumps({"error": f"symptoms must be 1-{MAX_SYMPTOMS_LENGTH} chars."}), 413)
+_ERR_UNSUPPORTED_LANGUAGE = (orjson.dumps({"error": f"Unsupported language. Use one of: {', '.join(sorted(SUPPORTED_LANGUAGES))}."}), 400)
+_ERR_NO_API_KEY = (orjson.dumps({"error": "API_KEY not configured."}), 500)
+
+def _static_response(template, headers):
+    """Builds a response tuple from a pre-serialized (body, status) template."""
+    body, status = template
+    return (body, status, {**headers, **_JSON_HEADERS})
+
+def _read_json(request):
+    """
+    Parses the request body as a JSON object with orjson, without caching the
+    raw body on the request. Returns None for empty, invalid or non-object bodies.
+    """
+    try:
+        request_json = orjson.loads(request.get_data(cache=False) or b"{}")
+    except orjson.JSONDecodeError:
+        return None
+    return request_json if isinstance(request_json, dict) else None
+
+# Shared across requests; callers must not mutate it.
+_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '3600'
+}
+_PREFLIGHT_RESPONSE = ('', 204, _PREFLIGHT_HEADERS)
+
 def handle_cors(request):
     """Handles CORS preflight requests and sets necessary headers."""
     if request.method == 'OPTIONS':
-        headers = {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST',
-            'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Max-Age': '3600'
-        }
-        return ('', 204, headers)
+        return _PREFLIGHT_RESPONSE
+    # Fresh dict per request, since handlers add their own headers to it
     return {'Access-Control-Allow-Origin': '*'}
 
 @functions_framework.http
@@ -57,114 +326,166 @@ def pmdc_verify_doctor(request):
     if isinstance(headers, tuple):
         return headers
 
+    _start_firestore_warmup()
+
     try:
-        request_json = request.get_json(silent=True)
+        request_json = _read_json(request)
         if not request_json:
-            return (jsonify({"error": "No JSON payload provided."}), 400, headers)
+            return _static_response(_ERR_NO_JSON, headers)
 
         doctor_id = request_json.get('doctorId')
         pmdc_number = request_json.get('pmdcNumber')
         app_id = request_json.get('appId')
 
         if not doctor_id or not pmdc_number or not app_id:
-            return (jsonify({"error": "Missing doctorId, pmdcNumber, or appId."}), 400, headers)
+            return _static_response(_ERR_MISSING_PMDC_FIELDS, headers)
 
-        # Mock Verification Logic
-        is_verified = pmdc_number == "PMDC-12345"
+        # Both become Firestore path segments, and appId is also the lru_cache key
+        if not isinstance(doctor_id, str) or not isinstance(app_id, str):
+            return _static_response(_ERR_PMDC_ID_TYPE, headers)
+
+        # Mock Verification Logic: reject before touching Firestore.
+        # Compared as bytes in constant time; compare_digest rejects non-ASCII str.
+        is_verified = isinstance(pmdc_number, str) and hmac.compare_digest(pmdc_number.encode(), _MOCK_PMDC_BYTES)
+        if not is_verified:
+            resp = _REJECT_TMPL.copy()
+            resp["doctorId"] = doctor_id
+            return (orjson.dumps(resp), 200, {**headers, **_JSON_HEADERS})
+
+        doctor_ref: DocumentReference = _doctors_collection(app_id).document(doctor_id)
         
-        if is_verified:
-            doctor_ref: DocumentReference = db.document(f'artifacts/{app_id}/public/data/doctor_profiles/{doctor_id}')
-            
-            doctor_ref.update({
-                'is_pmdc_verified': True,
-                'verification_date': firestore.SERVER_TIMESTAMP,
-                'pmdc_number_status': 'verified'
-            })
-            
-            return (jsonify({
-                "verified": True,
-                "message": "PMDC verification successful. Doctor profile updated.",
-                "doctorId": doctor_id
-            }), 200, headers)
-        else:
-            return (jsonify({
-                "verified": False,
-                "message": "PMDC number failed mock verification check. Please check the number and try again.",
-                "doctorId": doctor_id
-            }), 200, headers)
+        # The frontend's onSnapshot listener picks the change up once it lands
+        _queue_update(doctor_ref, {
+            'is_pmdc_verified': True,
+            'verification_date': firestore.SERVER_TIMESTAMP,
+            'pmdc_number_status': 'verified'
+        })
+        
+        return (jsonify({
+            "verified": True,
+            "message": "PMDC verification successful. Doctor profile is being updated.",
+            "doctorId": doctor_id
+        }), 200, headers)
 
     except Exception as e:
         print(f"An error occurred during PMDC verification: {e}")
         return (jsonify({"error": f"Internal Server Error: {str(e)}"}), 500, headers)
 
+def _sse(data):
+    """Formats one server-sent event carrying a JSON payload."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+def _stream_headers(headers):
+    """Returns the CORS headers for an event-stream response."""
+    stream_headers = {k: v for k, v in headers.items() if k != 'Content-Type'}
+    stream_headers['Cache-Control'] = 'no-cache'
+    return stream_headers
+
+def _stream_analysis(gemini_response, cache_key):
+    """
+    Relays text deltas from Gemini's SSE stream to the client as server-sent events.
+    The full analysis is cached under cache_key only if Gemini finished with STOP,
+    so truncated or filtered answers are never replayed to other users.
+    """
+    texts = []
+    finish_reason = None
+    try:
+        for line in gemini_response.iter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = orjson.loads(line[5:])
+            if 'error' in chunk:
+                raise RuntimeError(f"Gemini stream error: {chunk['error']}")
+            candidate = (chunk.get('candidates') or [{}])[0]
+            finish_reason = candidate.get('finishReason', finish_reason)
+            parts = candidate.get('content', {}).get('parts', [])
+            text = "".join(part.get('text', '') for part in parts)
+            if text:
+                texts.append(text)
+                yield _sse({"text": text})
+        if texts:
+            if finish_reason == "STOP":
+                with _ANALYSIS_CACHE_LOCK:
+                    _ANALYSIS_CACHE[cache_key] = "".join(texts)
+        else:
+            yield _sse({"text": "Error: Could not retrieve AI analysis."})
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        print(f"An error occurred while streaming AI analysis: {e}")
+        yield _sse({"error": "AI service error: the analysis stream was interrupted."})
+    finally:
+        gemini_response.close()
+
 @functions_framework.http
 def ai_symptom_checker(request):
     """
     HTTP Cloud Function to securely call the Gemini API for symptom analysis.
+    The analysis is streamed back as server-sent events of the form {"text": ...}.
     """
+    import httpx
+
     headers = handle_cors(request)
     if isinstance(headers, tuple):
         return headers
     headers['Content-Type'] = 'application/json'
 
     try:
-        request_json = request.get_json(silent=True)
+        request_json = _read_json(request)
         if not request_json:
-            return (jsonify({"error": "No JSON payload provided."}), 400, headers)
+            return _static_response(_ERR_NO_JSON, headers)
 
         symptoms = request_json.get('symptoms')
         language = request_json.get('language', 'English')
 
         if not symptoms:
-            return (jsonify({"error": "Missing symptoms input."}), 400, headers)
+            return _static_response(_ERR_MISSING_SYMPTOMS, headers)
+
+        if not isinstance(symptoms, str):
+            return _static_response(_ERR_SYMPTOMS_TYPE, headers)
+
+        # Keep oversized input from ever reaching Gemini
+        if len(symptoms) > MAX_SYMPTOMS_LENGTH:
+            return _static_response(_ERR_SYMPTOMS_TOO_LONG, headers)
+
+        if not isinstance(language, str) or language not in SUPPORTED_LANGUAGES:
+            return _static_response(_ERR_UNSUPPORTED_LANGUAGE, headers)
         
         if not API_KEY:
-            return (jsonify({"error": "API_KEY not configured."}), 500, headers)
+            return _static_response(_ERR_NO_API_KEY, headers)
             
-        system_prompt = (
-            "You are HealthAlly, a culturally sensitive, preliminary AI health guide. "
-            "You MUST be extremely cautious and non-diagnostic. Your response MUST be in the requested language, which is "
-            f"'{language}'. "
-            "Your response must include three clearly separated sections using markdown bolding and list formatting, in this exact order:\n"
-            "1. **IMPORTANT DISCLAIMER:** A bold, explicit warning that you are NOT a doctor and your advice is not a diagnosis. State: 'This information is for informational purposes only. Consult a verified doctor immediately for a diagnosis.'\n"
-            "2. **Possible Common Causes:** A list of 3-5 possible, common, non-life-threatening causes for the symptoms.\n"
-            "3. **Recommended Next Steps:** Clear, conservative advice, such as 'Monitor symptoms for 24 hours and stay hydrated' or 'Seek immediate medical attention if symptoms worsen or include chest pain/difficulty breathing.'\n"
-            "Keep the response professional, empathetic, and focus on the patient's safety. Use concise, clear language."
-        )
-        
-        user_query = f"The patient reports the following symptoms: {symptoms}. Provide a preliminary analysis."
+        cache_key = (symptoms, language)
+        with _ANALYSIS_CACHE_LOCK:
+            cached = _ANALYSIS_CACHE.get(cache_key)
+        if cached is not None:
+            return Response(_sse({"text": cached}), headers=_stream_headers(headers), mimetype="text/event-stream")
+
+        user_query = _QPREFIX + symptoms + _QSUFFIX
 
         payload = {
             "contents": [{"parts": [{"text": user_query}]}],
-            "systemInstruction": {"parts": [{"text": system_prompt}]},
-            "tools": [{"google_search": {}}]
+            "systemInstruction": SYS_PROMPTS[language],
+            "tools": _TOOLS
         }
 
-        gemini_response = None
-        max_retries = 3
-        
-        for attempt in range(max_retries):
-            try:
-                gemini_response = requests.post(f"{GEMINI_API_URL}?key={API_KEY}", json=payload, timeout=30)
-                gemini_response.raise_for_status()
-                break
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                else:
-                    raise e
-
-        result = gemini_response.json()
-        generated_text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', 'Error: Could not retrieve AI analysis.')
+        gemini_response = _post_gemini(payload)
+        if gemini_response.is_error:
+            # Load the body so the error handler can log it
+            gemini_response.read()
+            gemini_response.raise_for_status()
 
-        return (jsonify({
-            "success": True,
-            "analysis": generated_text
-        }), 200, headers)
+        # Errors above are still returned as JSON; the analysis itself is streamed
+        resp = Response(stream_with_context(_stream_analysis(gemini_response, cache_key)), headers=_stream_headers(headers), mimetype="text/event-stream")
+        # The generator's finally never runs if the client leaves before the first
+        # chunk, so release the upstream connection when the response closes too
+        resp.call_on_close(gemini_response.close)
+        return resp
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error calling Gemini API: {http_err}. Response: {getattr(gemini_response, 'text', 'N/A')}")
-        return (jsonify({"error": f"AI service error: {http_err}"}), gemini_response.status_code if gemini_response else 500, headers)
+    except httpx.HTTPStatusError as http_err:
+        # Report only the status; Gemini's body is logged but never echoed to the client
+        status = http_err.response.status_code
+        print(f"HTTP error calling Gemini API: status {status}. Response: {http_err.response.text}")
+        # Upstream failures (including Gemini's own 4xx) are reported as a bad gateway
+        return (jsonify({"error": f"AI service error: Gemini returned HTTP {status}."}), 502, headers)
     except Exception as e:
         print(f"An error occurred during AI analysis: {e}")
         return (jsonify({"error": f"Internal Server Error: {str(e)}"}), 500, headers)